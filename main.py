@@ -17,7 +17,10 @@ taqaddum_appointments.py — PySide6
 - قسم "👤 المستخدمون": إضافة/حذف مستخدمين دخول (تخزين نصّي بسيط).
 """
 
-import os, sys, sqlite3, datetime, html
+import os, re, sys, sqlite3, datetime, html, queue, gzip, shutil, time, threading
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, compress
 from typing import List, Optional
 
 from PySide6 import QtCore, QtGui, QtWidgets
@@ -32,6 +35,9 @@ from PySide6.QtWidgets import (
 
 APP_NAME = "نظام مواعيد — حزب تقدم"
 DB_NAME  = "appointments.db"
+BACKUP_DIR   = "backups"
+BACKUP_KEEP  = 7                  # عدد اللقطات المحفوظة
+BACKUP_EVERY = 6*60*60            # ثوانٍ بين النسخ التلقائية
 
 # ===================== مساعدات الصور والخلفية =====================
 def _candidate_dirs() -> List[str]:
@@ -107,6 +113,30 @@ def ensure_db():
     """)
     cur.execute("CREATE INDEX IF NOT EXISTS idx_appt_dt ON appointments(appt_dt)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_person ON appointments(person)")
+    # نص المرافقين الذي بُنيت منه صفوف الجدول الفرعي (لاكتشاف التعديل من خارج البرنامج)
+    _add_column_if_missing(cur, "appointments", "companions_src TEXT", "companions_src")
+
+    # جدول المرافقين: صف لكل مرافق مع اسم مطبَّع للبحث المفهرس
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS appointment_companions(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            appt_id INTEGER NOT NULL REFERENCES appointments(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            name_norm TEXT NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comp_name ON appointment_companions(name_norm)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comp_appt ON appointment_companions(appt_id)")
+    # كلمات أسماء المرافقين: ليطابق البحث عن "علي" المرافقَ "أحمد علي"
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS appointment_companion_words(
+            appt_id INTEGER NOT NULL REFERENCES appointments(id) ON DELETE CASCADE,
+            word TEXT NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comp_word ON appointment_companion_words(word)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comp_word_appt ON appointment_companion_words(appt_id)")
+    sync_all_companions(cur)
 
     # جدول المستخدمين (إنشاء مبدئي بسيط ثم ترقية للأعمدة الناقصة)
     cur.execute("""
@@ -132,6 +162,83 @@ def ensure_db():
 
     con.commit(); con.close()
 
+# ===================== المرافقون (تطبيع + مزامنة) =====================
+_AR_MARKS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")  # تشكيل + تطويل
+_AR_LETTERS = (("أ","ا"), ("إ","ا"), ("آ","ا"), ("ٱ","ا"), ("ى","ي"), ("ئ","ي"), ("ؤ","و"), ("ة","ه"))
+_COMP_SEP = re.compile(r"[,،;؛\n]+")
+_SPACES = re.compile(r"\s{2,}|[^\S ]")   # ما يغيّره توحيد المسافات؛ لا يشمل \x00 (فاصل صفوف TextColumn)
+
+def fold_ar(text: str) -> str:
+    """حذف التشكيل والتطويل وتوحيد الألف/الياء/التاء المربوطة + أحرف صغيرة (دون لمس المسافات)."""
+    t = _AR_MARKS.sub("", text or "")
+    for a, b in _AR_LETTERS:   # replace متتالية أسرع بكثير من translate على نص عربي طويل
+        t = t.replace(a, b)
+    return t.lower()
+
+def normalize_ar(text: str) -> str:
+    """تطبيع الاسم للمقارنة: fold_ar ثم توحيد المسافات."""
+    return " ".join(fold_ar(text).split())
+
+def parse_companions(text: str) -> List[str]:
+    """يفصل نص المرافقين (فواصل عربية/إنجليزية أو أسطر) إلى أسماء."""
+    return [n for n in (" ".join(x.split()) for x in _COMP_SEP.split(text or "")) if n]
+
+def sync_companions(cur, appt_id: int, text: str):
+    names = [(n, normalize_ar(n)) for n in parse_companions(text)]
+    words = {w for _, nn in names for w in nn.split()}
+    cur.execute("DELETE FROM appointment_companions WHERE appt_id=?", (appt_id,))
+    cur.execute("DELETE FROM appointment_companion_words WHERE appt_id=?", (appt_id,))
+    cur.executemany("INSERT INTO appointment_companions(appt_id,name,name_norm) VALUES(?,?,?)",
+                    [(appt_id, n, nn) for n, nn in names])
+    cur.executemany("INSERT INTO appointment_companion_words(appt_id,word) VALUES(?,?)",
+                    [(appt_id, w) for w in words])
+    cur.execute("UPDATE appointments SET companions_src=? WHERE id=?", (text or "", appt_id))
+
+def sync_all_companions(cur):
+    """يعيد بناء صفوف المرافقين لكل موعد تغيّر نصه منذ آخر مزامنة (قاعدة قديمة/مستوردة/معدّلة خارجيًا) ويحذف صفوف المواعيد المحذوفة."""
+    cur.execute("DELETE FROM appointment_companions WHERE appt_id NOT IN (SELECT id FROM appointments)")
+    cur.execute("DELETE FROM appointment_companion_words WHERE appt_id NOT IN (SELECT id FROM appointments)")
+    cur.execute("""SELECT id, companions FROM appointments
+                   WHERE COALESCE(companions,'') IS NOT COALESCE(companions_src,'')""")
+    for _id, comp in cur.fetchall():
+        sync_companions(cur, _id, comp)
+
+def save_appointment(appt_id: Optional[int], values: tuple) -> int:
+    """إدراج/تحديث موعد ومزامنة مرافقيه في معاملة واحدة. values بترتيب أعمدة النموذج."""
+    con = sqlite3.connect(DB_NAME); cur = con.cursor()
+    if appt_id is None:
+        cur.execute("""INSERT INTO appointments(person,phone,address,notes,companions,appt_dt,remind_amount,remind_unit,notified,snooze_until)
+                       VALUES(?,?,?,?,?,?,?,?,0,NULL)""", values)
+        appt_id = cur.lastrowid
+    else:
+        cur.execute("""UPDATE appointments SET person=?,phone=?,address=?,notes=?,companions=?,
+                       appt_dt=?,remind_amount=?,remind_unit=?,notified=0,snooze_until=NULL WHERE id=?""",
+                    values + (appt_id,))
+    sync_companions(cur, appt_id, values[4])
+    con.commit(); con.close()
+    return appt_id
+
+def delete_appointment(appt_id: int):
+    con = sqlite3.connect(DB_NAME); cur = con.cursor()
+    cur.execute("DELETE FROM appointment_companions WHERE appt_id=?", (appt_id,))
+    cur.execute("DELETE FROM appointment_companion_words WHERE appt_id=?", (appt_id,))
+    cur.execute("DELETE FROM appointments WHERE id=?", (appt_id,))
+    con.commit(); con.close()
+
+def find_companion_appts(query: str) -> set:
+    """
+    معرّفات المواعيد التي يبدأ اسم أحد مرافقيها، أو أي كلمة منه، بالنص المطبَّع
+    (بحثان نطاقيان على الفهرسين).
+    """
+    qn = normalize_ar(query)
+    if not qn: return set()
+    hi = qn + "\uffff"
+    rows = db_q("""SELECT appt_id FROM appointment_companions WHERE name_norm>=? AND name_norm<?
+                   UNION
+                   SELECT appt_id FROM appointment_companion_words WHERE word>=? AND word<?""",
+                (qn, hi, qn, hi))
+    return {r[0] for r in rows}
+
 def db_q(q, a=()):
     con = sqlite3.connect(DB_NAME); cur = con.cursor()
     cur.execute(q, a); rows = cur.fetchall(); con.close(); return rows
@@ -140,6 +247,302 @@ def db_x(q, a=()):
     con = sqlite3.connect(DB_NAME); cur = con.cursor()
     cur.execute(q, a); con.commit(); con.close()
 
+# ===================== النسخ الاحتياطي (SQLite online backup) =====================
+def _backup_dir() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), BACKUP_DIR)
+
+class BackupCancelled(Exception):
+    """أُلغي النسخ الاحتياطي قبل اكتماله (مثلًا عند إغلاق البرنامج)."""
+
+def _check_cancel(cancel: Optional[threading.Event]):
+    if cancel is not None and cancel.is_set():
+        raise BackupCancelled("أُلغي النسخ الاحتياطي")
+
+def _integrity_ok(path: str, cancel: Optional[threading.Event] = None) -> bool:
+    con = sqlite3.connect(path)
+    if cancel is not None:   # يقطع الفحص الطويل (OperationalError: interrupted) عند الإلغاء
+        con.set_progress_handler(lambda: int(cancel.is_set()), 10000)
+    try:
+        r = con.execute("PRAGMA integrity_check").fetchone()
+    finally:
+        con.close()
+    return r is not None and r[0] == "ok"
+
+def list_backups() -> List[str]:
+    """مسارات اللقطات المضغوطة، الأحدث أولًا (الاسم يحمل الطابع الزمني)."""
+    d = _backup_dir()
+    if not os.path.isdir(d): return []
+    names = sorted((n for n in os.listdir(d) if n.startswith("appointments-") and n.endswith(".db.gz")), reverse=True)
+    return [os.path.join(d, n) for n in names]
+
+def backup_db(cancel: Optional[threading.Event] = None, pages: int = 64, pause: float = 0.005) -> str:
+    """
+    لقطة حيّة للقاعدة: تُنسخ على دفعات من الصفحات مع استراحة قصيرة بين كل دفعة
+    كي تبقى الكتابات العادية ممكنة، ثم فحص السلامة وضغط gzip وتدوير اللقطات القديمة.
+    ضبط cancel يوقف العملية بين الدفعات ويحذف الملفات المؤقتة.
+    """
+    def step(*_):
+        _check_cancel(cancel); time.sleep(pause)
+
+    d = _backup_dir(); os.makedirs(d, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    tmp = os.path.join(d, f".snapshot-{stamp}.db")
+    out = os.path.join(d, f"appointments-{stamp}.db.gz")
+    try:
+        src = sqlite3.connect(DB_NAME); dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst, pages=pages, progress=step)
+        finally:
+            dst.close(); src.close()
+        try:
+            ok = _integrity_ok(tmp, cancel)
+        except sqlite3.OperationalError:
+            _check_cancel(cancel); raise
+        if not ok:
+            raise sqlite3.DatabaseError("فشل فحص سلامة النسخة الاحتياطية")
+        with open(tmp, "rb") as f, gzip.open(out + ".part", "wb") as g:
+            while chunk := f.read(1 << 20):
+                _check_cancel(cancel); g.write(chunk)
+        os.replace(out + ".part", out)
+    finally:
+        for junk in (tmp, out + ".part"):
+            if os.path.exists(junk): os.remove(junk)
+    for old in list_backups()[BACKUP_KEEP:]:
+        os.remove(old)
+    return out
+
+def restore_db(snapshot: str):
+    """يستعيد لقطة فوق القاعدة الحية بعد التحقق من سلامتها، ثم يرقّي المخطط ويزامن المرافقين."""
+    os.makedirs(_backup_dir(), exist_ok=True)   # قد تكون اللقطة من مكان آخر على تثبيت جديد
+    tmp = os.path.join(_backup_dir(), ".restore.db")
+    try:
+        with gzip.open(snapshot, "rb") as g, open(tmp, "wb") as f:
+            shutil.copyfileobj(g, f)
+        if not _integrity_ok(tmp):
+            raise sqlite3.DatabaseError("اللقطة تالفة ولا يمكن استعادتها")
+        src = sqlite3.connect(tmp); dst = sqlite3.connect(DB_NAME)
+        try:
+            src.backup(dst)   # خطوة واحدة: الاستبدال ذرّي بالنسبة لبقية الاتصالات
+        finally:
+            dst.close(); src.close()
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    ensure_db()
+
+# ===================== عامل قاعدة البيانات (خيط خلفي) =====================
+class DbJob:
+    """طلب واحد في طابور العامل: دالة + معاملات + ردّا النداء (نجاح/خطأ)."""
+    __slots__ = ("fn", "args", "on_done", "on_error", "key", "cancelled")
+
+    def __init__(self, fn, args, on_done=None, on_error=None, key=None):
+        self.fn = fn; self.args = args
+        self.on_done = on_done; self.on_error = on_error
+        self.key = key; self.cancelled = False
+
+class DbWorker(QtCore.QThread):
+    """
+    خيط واحد ينفّذ عمليات SQLite والقرص بالترتيب (FIFO) بعيدًا عن خيط الواجهة:
+    - الكتابات تُنفَّذ بنفس ترتيب إرسالها.
+    - الطلبات ذات المفتاح نفسه (مثل "refresh") تُدمج: الأحدث يلغي الأقدم المعلّق،
+      ونتيجة أي طلب صار قديمًا تُهمل ولا تصل للواجهة.
+    - النتائج تعود لخيط الواجهة عبر إشارات Qt.
+    """
+    job_done   = QtCore.Signal(object, object)   # (DbJob, النتيجة)
+    job_failed = QtCore.Signal(object, object)   # (DbJob, الاستثناء)
+    busy_changed = QtCore.Signal(int)            # عدد الطلبات غير المنتهية
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._q: "queue.Queue[Optional[DbJob]]" = queue.Queue()
+        self._latest = {}   # key -> أحدث DbJob
+        self._pending = 0
+        self.job_done.connect(self._deliver)
+        self.job_failed.connect(self._deliver_error)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None) -> DbJob:
+        job = DbJob(fn, args, on_done, on_error, key)
+        if key is not None:
+            old = self._latest.get(key)
+            if old is not None:
+                old.cancelled = True
+            self._latest[key] = job
+        self._pending += 1; self.busy_changed.emit(self._pending)
+        self._q.put(job)
+        return job
+
+    def pending(self) -> int:
+        return self._pending
+
+    def cancel(self, key):
+        """يلغي أحدث طلب معلّق بهذا المفتاح؛ نتيجته إن وصلت تُهمل."""
+        job = self._latest.get(key)
+        if job is not None:
+            job.cancelled = True
+
+    def stop(self, discard: bool = False):
+        """
+        ينهي الخيط بعد تنفيذ كل ما في الطابور (لا تضيع كتابة معلّقة).
+        discard=True يتخلّص من الطلبات التي لم تبدأ بعد (للعمليات القابلة للإهمال كالنسخ الاحتياطي).
+        """
+        if discard:
+            try:
+                while True: self._q.get_nowait()
+            except queue.Empty:
+                pass
+        self._q.put(None); self.wait()
+
+    def run(self):
+        while True:
+            job = self._q.get()
+            if job is None:
+                break
+            if job.cancelled:
+                self.job_done.emit(job, None); continue
+            try:
+                res = job.fn(*job.args)
+            except Exception as e:
+                self.job_failed.emit(job, e); continue
+            self.job_done.emit(job, res)
+
+    # --- تُستدعى على خيط الواجهة ---
+    def _settle(self, job: DbJob):
+        if job.key is not None and self._latest.get(job.key) is job:
+            del self._latest[job.key]
+        self._pending -= 1; self.busy_changed.emit(self._pending)
+
+    def _deliver(self, job: DbJob, res):
+        self._settle(job)
+        if not job.cancelled and job.on_done:
+            job.on_done(res)
+
+    def _deliver_error(self, job: DbJob, err):
+        self._settle(job)
+        if not job.cancelled and job.on_error:
+            job.on_error(err)
+
+# ===================== لقطة عمودية للمواعيد =====================
+ST_OPEN, ST_DONE, ST_SNOOZED = 0, 1, 2
+_OPEN_MASK = bytes([1, 0, 0]) + bytes(253)   # جداول translate: رمز الحالة -> 0/1
+_DONE_MASK = bytes([0, 1, 0]) + bytes(253)
+UNITS = ("days", "hours", "minutes")          # رموز عمود الوحدة
+_UNIT_SECS = (86400, 3600, 60)
+
+class TextColumn:
+    """
+    عمود نصي مضغوط: كل القيم في سلسلة واحدة تفصلها \x00 مع مصفوفة بدايات،
+    بدل كائن str لكل صف. القراءة تقطع الشريحة عند الطلب.
+    """
+    __slots__ = ("data", "start", "spaced")
+
+    def __init__(self, values):
+        vals = [(v or "").replace("\x00", "") for v in values]
+        self.data = "\x00".join(vals) + "\x00"
+        self.start = array("I", accumulate((len(v) + 1 for v in vals), initial=0))
+        # يُحسب مرة عند البناء: regex على نص عربي طويل مكلف، ونادرًا ما يلزم (غالبًا الملاحظات فقط)
+        self.spaced = _SPACES.search(fold_ar(self.data)) is not None
+
+    def __getitem__(self, i: int) -> str:
+        s = self.start
+        return self.data[s[i]:s[i+1]-1]
+
+    def folded(self) -> str:
+        """السلسلة كاملة مطبَّعة كما يُطبَّع نص البحث (fold_ar + توحيد المسافات)؛ الفواصل \x00 باقية."""
+        hay = fold_ar(self.data)
+        return _SPACES.sub(" ", hay) if self.spaced else hay
+
+    @staticmethod
+    def mark_matches(hay: str, qn: str, mask: bytearray):
+        """يضع 1 في mask لكل صف يحتوي qn في hay (ناتج folded). qn يجب ألّا يكون فارغًا."""
+        row, last = 0, 0
+        pos = hay.find(qn)
+        while pos >= 0:
+            row += hay.count("\x00", last, pos)
+            mask[row] = 1
+            last = hay.find("\x00", pos) + 1; row += 1   # انتقل لبداية الصف التالي
+            pos = hay.find(qn, last)
+
+class ApptSnapshot:
+    """
+    جدول المواعيد في الذاكرة على شكل أعمدة بدل قائمة صفوف:
+    أعداد في array (المعرّف، الموعد ووقت التذكير بالثواني، مقدار التذكير، عدد المرافقين)،
+    الحالة ورمز الوحدة في bytearray، والنصوص في TextColumn. الصفوف مرتبة تصاعديًا حسب الموعد،
+    لذا فلتر "اليوم" وحدّ "المتأخرة" بحث ثنائي، وأقنعة الحالة تُبنى بـ bytes.translate.
+    """
+    def __init__(self, rows):
+        eps = [int(datetime.datetime.fromisoformat(r[6]).timestamp()) for r in rows]
+        rows = [rows[i] for i in sorted(range(len(rows)), key=eps.__getitem__)]
+        eps.sort()
+        self.id = array("q", (r[0] for r in rows))
+        self.epoch = array("q", eps)
+        self.amt = array("I", (int(r[7] or 0) for r in rows))
+        self.unit = bytearray(UNITS.index(r[8]) if r[8] in UNITS else 0 for r in rows)
+        self.remind_at = array("q", (e - a*_UNIT_SECS[u] for e, a, u in zip(eps, self.amt, self.unit)))
+        self.status = bytearray(ST_DONE if r[9] else (ST_SNOOZED if r[10] else ST_OPEN) for r in rows)
+        self.n_comp = array("I", (r[11] or 0 for r in rows))
+        self.person, self.phone, self.address, self.notes, self.companions = (
+            TextColumn(r[c] for r in rows) for c in (1, 2, 3, 4, 5))
+
+    def __len__(self): return len(self.id)
+
+    def iso(self, i: int) -> str:
+        return datetime.datetime.fromtimestamp(self.epoch[i]).isoformat()
+
+    def reminders_due(self, now: datetime.datetime) -> bool:
+        """هل دخل موعد قادم غير منجز نافذة تذكيره؟ (التأجيل يُفحص لاحقًا على القاعدة)"""
+        t = int(now.timestamp()); ra, st = self.remind_at, self.status
+        return any(ra[i] <= t and st[i] != ST_DONE for i in range(bisect_left(self.epoch, t), len(self)))
+
+    def late_cut(self, now: datetime.datetime) -> int:
+        """كل صف مفتوح قبل هذا الفهرس موعده فات."""
+        return bisect_left(self.epoch, int(now.timestamp()))
+
+    def select(self, mode: str, now: datetime.datetime):
+        if mode == "today":
+            day = datetime.datetime.combine(now.date(), datetime.time())
+            lo = bisect_left(self.epoch, int(day.timestamp()))
+            hi = bisect_left(self.epoch, int((day + datetime.timedelta(days=1)).timestamp()))
+            return range(lo, hi)
+        if mode == "late":
+            cut = self.late_cut(now)
+            return list(compress(range(cut), self.status[:cut].translate(_OPEN_MASK)))
+        if mode == "done":
+            return list(compress(range(len(self)), self.status.translate(_DONE_MASK)))
+        return range(len(self))
+
+    def match(self, q: str, comp_ids: set) -> Optional[bytearray]:
+        """
+        قناع الصفوف المطابقة لنص البحث المطبَّع في الاسم/الهاتف/السكن/الملاحظات/المرافقين،
+        أو معرّف من فهرس المرافقين. نص من عدة كلمات يطابق الصف إن وُجدت كل كلمة في أحد حقوله
+        (كما كان البحث على الحقول مدموجة). None إن كان النص فارغًا بعد التطبيع = لا بحث.
+        """
+        qn = normalize_ar(q)
+        if not qn: return None
+        n = len(self)
+        hays = [c.folded() for c in (self.person, self.phone, self.address, self.notes, self.companions)]
+        hit = None
+        for w in qn.split():
+            m = bytearray(n)
+            for hay in hays:
+                TextColumn.mark_matches(hay, w, m)
+            if hit is None: hit = m
+            else:   # AND للأقنعة دفعة واحدة عبر أعداد صحيحة
+                hit = bytearray((int.from_bytes(hit, "little") & int.from_bytes(m, "little")).to_bytes(n, "little"))
+        if comp_ids:
+            for k, _id in enumerate(self.id):
+                if _id in comp_ids: hit[k] = 1
+        return hit
+
+def search_snapshot(snap: ApptSnapshot, q: str) -> Optional[bytearray]:
+    # يُنفَّذ على العامل: اللقطة لا تتغير بعد بنائها
+    return snap.match(q, find_companion_appts(q))
+
+def load_snapshot() -> ApptSnapshot:
+    # الترتيب حسب الموعد يتم داخل ApptSnapshot على عمود الثواني بدل ORDER BY datetime(...)
+    return ApptSnapshot(db_q("""SELECT a.id, a.person, a.phone, a.address, a.notes, a.companions,
+                                       a.appt_dt, a.remind_amount, a.remind_unit, a.notified, a.snooze_until,
+                                       (SELECT COUNT(*) FROM appointment_companions c WHERE c.appt_id=a.id)
+                                FROM appointments a"""))
+
 # ===================== حوار الدخول =====================
 class LoginDialog(QDialog):
     def __init__(self):
@@ -327,6 +730,16 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(1220, 740)
         self.setWindowIcon(QIcon(find_image("3") or ""))
 
+        self._all = ApptSnapshot([])
+        self.db = DbWorker(self)
+        self.db.busy_changed.connect(self._on_busy)
+        self.db.start()
+        # خيط مستقل للنسخ الاحتياطي كي لا تنتظر الاستعلامات والكتابات انتهاء النسخ
+        self.backup = DbWorker(self)
+        self.backup.busy_changed.connect(self._on_busy)
+        self.backup.start()
+        self._backup_cancel = threading.Event()
+
         self._build_ui()
         self.refresh()
 
@@ -334,6 +747,13 @@ class MainWindow(QMainWindow):
         self.timer.timeout.connect(self.check_reminders)
         self.timer.start(60*1000)
 
+        self.backup_timer = QTimer(self)
+        self.backup_timer.timeout.connect(lambda: self.run_backup(auto=True))
+        self.backup_timer.start(BACKUP_EVERY*1000)
+        last = list_backups()
+        if not last or time.time() - os.path.getmtime(last[0]) > BACKUP_EVERY:
+            QTimer.singleShot(10*1000, lambda: self.run_backup(auto=True))
+
     def _css(self) -> str:
         return """
         #Card{ background:rgba(255,255,255,.08); border:1px solid rgba(255,255,255,.18); border-radius:18px; }
@@ -404,12 +824,17 @@ class MainWindow(QMainWindow):
         self.btn_export=QPushButton("تصدير بطاقة"); self.btn_export.clicked.connect(self.export_card)
         self.btn_report=QPushButton("تقرير اليوم (PNG)"); self.btn_report.clicked.connect(self.export_today_report)
         self.btn_users=QPushButton("👤 المستخدمون"); self.btn_users.clicked.connect(self.open_users)
+        self.btn_backup=QPushButton("💾 النسخ الاحتياطي")
+        bm = QtWidgets.QMenu(self.btn_backup)
+        act_bk = QAction("نسخة احتياطية الآن", self); act_bk.triggered.connect(lambda: self.run_backup(auto=False))
+        act_rs = QAction("استعادة نسخة…", self); act_rs.triggered.connect(self.restore_backup)
+        bm.addAction(act_bk); bm.addAction(act_rs); self.btn_backup.setMenu(bm)
 
         for b in [self.btn_all,self.btn_today,self.btn_late,self.btn_done]:
             top.addWidget(b)
         top.addSpacing(10); top.addWidget(self.btn_mark)
         top.addStretch(1)
-        top.addWidget(self.btn_export); top.addWidget(self.btn_report); top.addWidget(self.btn_users)
+        top.addWidget(self.btn_export); top.addWidget(self.btn_report); top.addWidget(self.btn_backup); top.addWidget(self.btn_users)
         main.addLayout(top)
 
         # Body
@@ -433,9 +858,9 @@ class MainWindow(QMainWindow):
         F.addWidget(QLabel("الملاحظات:"),4,0); F.addWidget(self.e_notes,4,1,1,3)
         bb = QHBoxLayout()
         b_new=QPushButton("جديد"); b_new.clicked.connect(self.clear_form)
-        b_save=QPushButton("حفظ/تحديث"); b_save.clicked.connect(self.save_record)
+        self.btn_save=QPushButton("حفظ/تحديث"); self.btn_save.clicked.connect(self.save_record)
         b_del=QPushButton("حذف"); b_del.clicked.connect(self.delete_record)
-        bb.addWidget(b_new); bb.addWidget(b_save); bb.addWidget(b_del); bb.addStretch(1)
+        bb.addWidget(b_new); bb.addWidget(self.btn_save); bb.addWidget(b_del); bb.addStretch(1)
         F.addLayout(bb,5,0,1,4)
         body.addWidget(form_card,4)
 
@@ -451,9 +876,54 @@ class MainWindow(QMainWindow):
         v.addWidget(self.table,1)
         body.addWidget(table_card,6)
 
+        self.busy_lbl = QLabel("⏳ جارٍ العمل…"); self.busy_lbl.setVisible(False)
+        self.statusBar().addPermanentWidget(self.busy_lbl)
         self.statusBar().showMessage("جاهز.")
         self._mode="all"; self._current_id=None
 
+    # --------------------- العامل الخلفي ---------------------
+    def _db(self, fn, *args, on_done=None, on_error=None, key=None):
+        """يرسل عملية إلى عامل قاعدة البيانات؛ الأخطاء تظهر كرسالة على خيط الواجهة ثم يُستدعى on_error."""
+        def failed(e):
+            QMessageBox.critical(self, "خطأ", f"تعذر تنفيذ العملية:\n{e}")
+            if on_error: on_error(e)
+        return self.db.submit(fn, *args, on_done=on_done, on_error=failed, key=key)
+
+    def _on_busy(self, _n: int = 0):
+        self.busy_lbl.setVisible(self.db.pending() + self.backup.pending() > 0)
+
+    def closeEvent(self, e):
+        self.timer.stop(); self.backup_timer.stop()
+        # نسخة جارية تُقطع بين الدفعات بدل انتظارها على قاعدة كبيرة
+        self._backup_cancel.set()
+        self.backup.stop(discard=True); self.db.stop()
+        super().closeEvent(e)
+
+    # --------------------- النسخ الاحتياطي ---------------------
+    def run_backup(self, auto: bool = False):
+        # نسخة واحدة في كل مرة: الطلب الجديد لا يوقف الجاري، فتشغيل نسختين معًا هدر وتصادم أسماء
+        if self.backup.pending():
+            if not auto: QMessageBox.information(self, "نسخ احتياطي", "يوجد نسخ احتياطي جارٍ بالفعل.")
+            return
+        def done(path):
+            self.statusBar().showMessage(f"تم حفظ نسخة احتياطية: {os.path.basename(path)}", 6000)
+        def failed(e):
+            if auto: self.statusBar().showMessage(f"تعذر النسخ الاحتياطي التلقائي: {e}", 8000)
+            else: QMessageBox.critical(self, "نسخ احتياطي", f"تعذر النسخ الاحتياطي:\n{e}")
+        self.backup.submit(backup_db, self._backup_cancel, on_done=done, on_error=failed)
+
+    def restore_backup(self):
+        snaps = list_backups()
+        start = snaps[0] if snaps else _backup_dir()
+        path, _ = QFileDialog.getOpenFileName(self, "استعادة نسخة", start, "SQLite gz (*.db.gz)")
+        if not path: return
+        if QMessageBox.question(self, "استعادة", f"استبدال البيانات الحالية بالنسخة «{os.path.basename(path)}»؟")!=QMessageBox.Yes:
+            return
+        # على عامل القاعدة نفسه: تُنفَّذ بعد الكتابات المعلّقة وقبل أي كتابة لاحقة
+        self.statusBar().showMessage("جارٍ الاستعادة…")
+        self._db(restore_db, path, on_done=lambda _: self.statusBar().showMessage("تمت الاستعادة.", 6000))
+        self.clear_form(); self.refresh()
+
     def open_users(self):
         dlg = UsersDialog(self)
         dlg.exec()
@@ -461,48 +931,60 @@ class MainWindow(QMainWindow):
 
     # --------------------- بيانات & جدول ---------------------
     def refresh(self):
-        self._all = db_q("""SELECT id, person, phone, address, notes, companions,
-                                   appt_dt, remind_amount, remind_unit, notified, snooze_until
-                            FROM appointments ORDER BY datetime(appt_dt) ASC""")
+        # طلبات التحديث المتكررة تُدمج في العامل: يصل للواجهة أحدثها فقط
+        self.statusBar().showMessage("جارٍ تحميل المواعيد…")
+        self._db(load_snapshot, on_done=self._on_loaded, key="refresh")
+
+    def _on_loaded(self, snap: ApptSnapshot):
+        self._all = snap
         self.apply_filter()
 
     def set_mode(self, mode): self._mode=mode; self.apply_filter()
 
     def apply_filter(self):
-        q = (self.e_search.text() or "").strip().lower()
-        now = datetime.datetime.now()
-        rows = self._all
-        if self._mode=="today":
-            rows = [r for r in rows if datetime.datetime.fromisoformat(r[6]).date()==now.date()]
-        elif self._mode=="late":
-            rows = [r for r in rows if r[9]==0 and not r[10] and datetime.datetime.fromisoformat(r[6])<now]
-        elif self._mode=="done":
-            rows = [r for r in rows if r[9]==1]
+        q = normalize_ar(self.e_search.text())
         if q:
-            rows = [r for r in rows if q in " ".join([str(x or "") for x in [r[1],r[2],r[3],r[4],r[5]]]).lower()]
-        self.fill_table(rows)
+            # البحث النصي وفهرس المرافقين على العامل؛ كل حرف جديد يلغي الاستعلام السابق
+            snap = self._all
+            self._db(search_snapshot, snap, q, key="search",
+                     on_done=lambda hit, snap=snap: self._filter_rows(hit) if snap is self._all else self.apply_filter())
+        else:
+            # مربّع فارغ (أو تطويل/تشكيل فقط): بحث سابق في الطابور يجب ألّا يستبدل الجدول
+            self.db.cancel("search")
+            self._filter_rows(None)
+
+    def _filter_rows(self, hit: Optional[bytearray]):
+        now = datetime.datetime.now()
+        snap = self._all
+        idx = snap.select(self._mode, now)
+        if hit is not None:
+            idx = [i for i in idx if hit[i]]
+        self.fill_table(snap, idx, snap.late_cut(now))
 
-    def fill_table(self, rows):
+    def fill_table(self, snap: ApptSnapshot, idx, late_cut: int):
         self.table.setRowCount(0)
-        for r in rows:
-            _id, person, phone, addr, notes, comp, iso, amt, unit, notified, snooze = r
-            dt = datetime.datetime.fromisoformat(iso)
+        units = {"days":"يوم/أيام","hours":"ساعة/ساعات","minutes":"دقيقة/دقائق"}
+        labels = {ST_DONE:"تم", ST_SNOOZED:"مؤجّل"}
+        for i in idx:
+            st = snap.status[i]; notified = st == ST_DONE
+            dt = datetime.datetime.fromtimestamp(snap.epoch[i])
             row = self.table.rowCount(); self.table.insertRow(row)
             items = [
-                QTableWidgetItem(str(_id)),
-                QTableWidgetItem(person or ""), QTableWidgetItem(phone or ""), QTableWidgetItem(addr or ""),
+                QTableWidgetItem(str(snap.id[i])),
+                QTableWidgetItem(snap.person[i]), QTableWidgetItem(snap.phone[i]), QTableWidgetItem(snap.address[i]),
                 QTableWidgetItem(dt.strftime("%d/%m/%Y %I:%M %p")),
-                QTableWidgetItem(f"{amt} "+{"days":"يوم/أيام","hours":"ساعة/ساعات","minutes":"دقيقة/دقائق"}[unit]),
-                QTableWidgetItem(comp or ""), QTableWidgetItem(notes or ""),
-                QTableWidgetItem("تم" if notified else ("مؤجّل" if snooze else ("متأخر" if dt<datetime.datetime.now() else "قادم")))
+                QTableWidgetItem(f"{snap.amt[i]} "+units[UNITS[snap.unit[i]]]),
+                QTableWidgetItem(snap.companions[i]), QTableWidgetItem(snap.notes[i]),
+                QTableWidgetItem(labels.get(st) or ("متأخر" if i < late_cut else "قادم"))
             ]
             items[0].setTextAlignment(Qt.AlignCenter); items[5].setTextAlignment(Qt.AlignCenter)
             for it in items:
                 if notified: it.setForeground(QtGui.QBrush(QtGui.QColor("#a0ffa0")))
             for c,it in enumerate(items): self.table.setItem(row, c, it)
-            self.table.item(row,4).setData(Qt.UserRole, iso)
+            self.table.item(row,4).setData(Qt.UserRole, snap.iso(i))
+            self.table.item(row,6).setData(Qt.UserRole, snap.n_comp[i])
         self.table.resizeColumnsToContents(); self.table.horizontalHeader().setStretchLastSection(True)
-        self.statusBar().showMessage(f"عدد السجلات: {len(rows)}")
+        self.statusBar().showMessage(f"عدد السجلات: {len(idx)}")
 
     def clear_form(self):
         self._current_id=None; self.table.clearSelection()
@@ -528,32 +1010,44 @@ class MainWindow(QMainWindow):
         notes=self.e_notes.toPlainText().strip(); comp=self.e_comp.toPlainText().strip()
         iso=self.e_dt.dateTime().toPython().isoformat()
         amt=int(self.e_amt.value()); unit={"أيام":"days","ساعات":"hours","دقائق":"minutes"}[self.e_unit.currentText()]
-        if self._current_id is None:
-            db_x("""INSERT INTO appointments(person,phone,address,notes,companions,appt_dt,remind_amount,remind_unit,notified,snooze_until)
-                    VALUES(?,?,?,?,?,?,?,?,0,NULL)""",(p,phone,addr,notes,comp,iso,amt,unit))
-        else:
-            db_x("""UPDATE appointments SET person=?,phone=?,address=?,notes=?,companions=?,
-                    appt_dt=?,remind_amount=?,remind_unit=?,notified=0,snooze_until=NULL WHERE id=?""",
-                 (p,phone,addr,notes,comp,iso,amt,unit,self._current_id))
-        self.refresh(); self.clear_form(); self.statusBar().showMessage("تم الحفظ/التحديث.")
+        # النموذج يُفرَّغ فقط بعد نجاح الكتابة؛ عند الخطأ تبقى البيانات المكتوبة كما هي.
+        # الزر معطَّل حتى تنتهي الكتابة كي لا تُدرج نقرة ثانية موعدًا مكرّرًا.
+        self.btn_save.setEnabled(False)
+        saving_id = self._current_id
+        self._db(save_appointment, saving_id, (p,phone,addr,notes,comp,iso,amt,unit),
+                 on_done=lambda _id: self._on_saved(saving_id),
+                 on_error=lambda _: self.btn_save.setEnabled(True))
+        self.statusBar().showMessage("جارٍ الحفظ…")
+
+    def _on_saved(self, saving_id: Optional[int]):
+        self.btn_save.setEnabled(True)
+        # إن حمّل المستخدم سجلًا آخر أثناء الحفظ فلا نمسح نموذجه
+        if self._current_id == saving_id: self.clear_form()
+        self.refresh()
+        self.statusBar().showMessage("تم الحفظ/التحديث.")
 
     def delete_record(self):
         r = self.table.currentRow()
         if r<0: return QMessageBox.information(self,"حذف","اختر سجلًا.")
         _id = int(self.table.item(r,0).text())
         if QMessageBox.question(self,"حذف",f"حذف السجل #{_id}؟")==QMessageBox.Yes:
-            db_x("DELETE FROM appointments WHERE id=?",(_id,)); self.refresh(); self.clear_form()
+            self._db(delete_appointment, _id); self.clear_form(); self.refresh()
 
     def mark_done(self):
         r = self.table.currentRow()
         if r<0: return QMessageBox.information(self,"تعليم","اختر سجلًا.")
-        _id = int(self.table.item(r,0).text()); db_x("UPDATE appointments SET notified=1, snooze_until=NULL WHERE id=?",(_id,)); self.refresh()
+        _id = int(self.table.item(r,0).text()); self._db(db_x, "UPDATE appointments SET notified=1, snooze_until=NULL WHERE id=?",(_id,)); self.refresh()
 
     # --------------------- التذكير ---------------------
     def check_reminders(self):
+        # فحص سريع على عمود remind_at في الذاكرة؛ القاعدة تُسأل فقط إن وُجد مرشّح
+        if not self._all.reminders_due(datetime.datetime.now()): return
+        self._db(db_q, """SELECT id, person, companions, appt_dt, remind_amount, remind_unit, notified, snooze_until
+                          FROM appointments WHERE notified=0""",
+                 on_done=self._on_reminders, key="reminders")
+
+    def _on_reminders(self, rows):
         now = datetime.datetime.now()
-        rows = db_q("""SELECT id, person, companions, appt_dt, remind_amount, remind_unit, notified, snooze_until
-                       FROM appointments WHERE notified=0""")
         for _id, person, comp, iso, amt, unit, _, snooze in rows:
             appt = datetime.datetime.fromisoformat(iso)
             if snooze:
@@ -565,11 +1059,11 @@ class MainWindow(QMainWindow):
                 dlg = ReminderDialog(person, comp or "", appt, self)
                 if dlg.exec()==QDialog.Accepted:
                     if dlg.action=="done":
-                        db_x("UPDATE appointments SET notified=1, snooze_until=NULL WHERE id=?",(_id,))
+                        self._db(db_x, "UPDATE appointments SET notified=1, snooze_until=NULL WHERE id=?",(_id,))
                     elif dlg.action=="snooze":
                         mins = dlg.sno_amt.value()*(60 if dlg.sno_unit.currentText()=="ساعات" else 1)
-                        db_x("UPDATE appointments SET snooze_until=? WHERE id=?",
-                             ((now+datetime.timedelta(minutes=mins)).isoformat(), _id))
+                        self._db(db_x, "UPDATE appointments SET snooze_until=? WHERE id=?",
+                                 ((now+datetime.timedelta(minutes=mins)).isoformat(), _id))
                 self.refresh()
 
     # --------------------- رسم بطاقات ---------------------
@@ -589,24 +1083,31 @@ class MainWindow(QMainWindow):
         p.setPen(QtGui.QPen(QtGui.QColor(0,0,0,30), 2)); p.setBrush(QtGui.QColor(255,255,255,235))
         p.drawRoundedRect(table, 16, 16)
 
-        headers = ["#","الاسم","الهاتف","السكن","التاريخ","الوقت","المرافقون"]
-        colw = [60, 270, 220, 240, 200, 140, table.width()-(60+270+220+240+200+140)-30]
+        headers = ["#","الاسم","الهاتف","السكن","التاريخ","الوقت","الحضور","المرافقون"]
+        colw = [60, 270, 220, 240, 200, 140, 110, table.width()-(60+270+220+240+200+140+110)-30]
         x = table.x()+15; y = table.y()+15; row_h = 48
         p.setPen(QtGui.QColor("#ff8c3a")); p.setFont(QFont("Cairo", 18, QFont.Bold))
         for i,h in enumerate(headers):
             p.drawText(x, y+36, colw[i], row_h, Qt.AlignLeft|Qt.AlignVCenter, h); x += colw[i]
         p.setFont(QFont("Cairo", 16)); p.setPen(QtGui.QColor("#222")); y += row_h + 8
         idx = 1
-        for person, phone, addr, iso, comp in rows:
+        for person, phone, addr, iso, comp, n_comp in rows:
             dt = datetime.datetime.fromisoformat(iso)
             line_rect = QtCore.QRect(table.x()+10, y, table.width()-20, row_h)
             draw_badge(p, line_rect, 10)
-            cells = [str(idx), person or "", phone or "", addr or "", dt.strftime("%d/%m/%Y"), dt.strftime("%I:%M %p"), comp or ""]
+            cells = [str(idx), person or "", phone or "", addr or "", dt.strftime("%d/%m/%Y"), dt.strftime("%I:%M %p"),
+                     str(1 + (n_comp or 0)), comp or ""]
             x = table.x()+15
             for i,val in enumerate(cells):
                 p.drawText(x, y+32, colw[i], row_h, Qt.AlignLeft|Qt.AlignVCenter, val); x += colw[i]
             y += row_h + 4; idx += 1
-            if y + row_h > table.bottom()-15: break
+            if y + 2*row_h > table.bottom()-15: break
+
+        # الإجمالي لكل الصفوف (عدد المرافقين لكل صف من تجميع SQL)
+        n_guests = len(rows); n_comps = sum(r[5] or 0 for r in rows)
+        p.setFont(QFont("Cairo", 18, QFont.Bold)); p.setPen(QtGui.QColor("#ff8c3a"))
+        p.drawText(QtCore.QRect(table.x()+15, table.bottom()-15-row_h, table.width()-30, row_h), Qt.AlignLeft|Qt.AlignVCenter,
+                   f"إجمالي الحضور: {n_guests + n_comps}  (الضيوف: {n_guests} — المرافقون: {n_comps})")
 
     def _draw_person_greeting_card(self, p: QPainter, rect: QtCore.QRect, record: dict):
         p.fillRect(rect, QtGui.QColor("#f7f6f3"))
@@ -641,6 +1142,7 @@ class MainWindow(QMainWindow):
         phone = record.get("phone") or "-"
         addr  = record.get("address") or "-"
         comp  = record.get("companions") or "-"
+        n_comp = record.get("companions_count") or 0
         try:
             dt = datetime.datetime.fromisoformat(record.get("appt_iso") or "")
             date_str = dt.strftime("%d/%m/%Y")
@@ -652,7 +1154,7 @@ class MainWindow(QMainWindow):
             f"الهاتف: {phone}",
             f"السكن: {addr}",
             f"التاريخ: {date_str}  —  الوقت: {time_str}",
-            f"المرافقون: {comp}",
+            f"المرافقون ({n_comp}): {comp}",
         ]:
             lr = QtCore.QRect(content.x(), y, content.width(), line_h)
             draw_badge(p, lr, 14)
@@ -675,8 +1177,14 @@ class MainWindow(QMainWindow):
         img.fill(QtGui.QColor("#f2f1ee"))
         p = QPainter(img); p.setRenderHints(QPainter.Antialiasing | QPainter.TextAntialiasing)
         painter_fn(p, QtCore.QRect(0,0,W,H), *args)
-        p.end(); img.save(path, "PNG")
-        QMessageBox.information(self, "تصدير", "تم حفظ الصورة بنجاح.")
+        p.end()
+        # الرسم على خيط الواجهة، أما الكتابة للقرص (الأبطأ على الهاتف) فعلى العامل
+        self.statusBar().showMessage("جارٍ حفظ الصورة…")
+        self._db(img.save, path, "PNG", on_done=self._on_png_saved)
+
+    def _on_png_saved(self, ok: bool):
+        if ok: QMessageBox.information(self, "تصدير", "تم حفظ الصورة بنجاح.")
+        else:  QMessageBox.critical(self, "تصدير", "تعذر حفظ الصورة.")
 
     def export_card(self):
         if self.table.rowCount()==0:
@@ -688,7 +1196,8 @@ class MainWindow(QMainWindow):
             addr  =self.table.item(r,3).text()
             iso   =self.table.item(r,4).data(Qt.UserRole)
             comp  =self.table.item(r,6).text()
-            all_rows.append((person,phone,addr,iso,comp))
+            n_comp=self.table.item(r,6).data(Qt.UserRole)
+            all_rows.append((person,phone,addr,iso,comp,n_comp))
 
         dlg = QDialog(self); dlg.setWindowTitle("خيارات التصدير"); dlg.setObjectName("ExportDlg")
         vb = QVBoxLayout(dlg)
@@ -714,18 +1223,24 @@ class MainWindow(QMainWindow):
             addr   = self.table.item(i,3).text()
             iso    = self.table.item(i,4).data(Qt.UserRole)
             comp   = self.table.item(i,6).text()
+            n_comp = self.table.item(i,6).data(Qt.UserRole)
             notes  = self.table.item(i,7).text() if self.table.item(i,7) else ""
-            record = {"person":person,"phone":phone,"address":addr,"notes":notes,"companions":comp,"appt_iso":iso}
+            record = {"person":person,"phone":phone,"address":addr,"notes":notes,"companions":comp,
+                      "companions_count":n_comp,"appt_iso":iso}
             self._export_png(self._draw_person_greeting_card, f"بطاقة_{person}.png", record)
         else:
             self._export_png(self._draw_list_card, "جدول_مواعيد_الدكتور.png",
                              "جدول مواعيد لقاءات الدكتور محمد شويش", all_rows)
 
     def export_today_report(self):
-        rows = db_q("""SELECT person,phone,address,appt_dt,companions
-                       FROM appointments
-                       WHERE date(appt_dt)=date('now','localtime')
-                       ORDER BY datetime(appt_dt) ASC""")
+        self._db(db_q, """SELECT a.person,a.phone,a.address,a.appt_dt,a.companions,COUNT(c.id)
+                          FROM appointments a LEFT JOIN appointment_companions c ON c.appt_id=a.id
+                          WHERE date(a.appt_dt)=date('now','localtime')
+                          GROUP BY a.id
+                          ORDER BY datetime(a.appt_dt) ASC""",
+                 on_done=self._on_today_rows, key="report")
+
+    def _on_today_rows(self, rows):
         if not rows: return QMessageBox.information(self,"تقرير اليوم","لا توجد مواعيد لليوم.")
         self._export_png(self._draw_list_card, "تقرير_اليوم.png",
                          "مواعيد اليوم — الدكتور محمد شويش", rows)